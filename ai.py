@@ -1,27 +1,144 @@
 import os
 import re
 import time
+import asyncio
 import logging
-from typing import List, Tuple
+import functools
+import threading
+from hashlib import blake2b
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple
 from dotenv import load_dotenv
-import requests
+import httpx
+import orjson
+import diskcache
+from cachetools import LRUCache
+import ahocorasick
+from pymorphy3 import MorphAnalyzer
 
 # === Настройки проекта ===
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# === Скомпилированные регулярные выражения ===
+_TERM_SPLIT_RE = re.compile(r',\s*')
+_EXPL_RE = re.compile(r"Объяснение:\s*(.*?)(?=\nИсправленное|$)", re.DOTALL)
+_CORR_RE = re.compile(r"Исправленное предложение:\s*(.*)")
+# Термин словаря, обрамлённый в {{{ ... }}} (см. telegram_bot.wrap_terms)
+_WRAPPED_TERM_RE = re.compile(r'\{\{\{.*?\}\}\}')
+
+class Correction(NamedTuple):
+    """Результат проверки одного предложения"""
+    orig: str
+    fixed: str
+    explanation: str
+
+
+# Ответ модели при сбое запроса — такие ответы не кэшируются
+ANALYSIS_ERROR = "Ошибка при анализе"
+
+# Кэш ответов модели по предложениям: {blake2b(sentence): (explanation, corrected)}
+_LLM_CACHE: LRUCache = LRUCache(maxsize=10_000)
+
+def _cache_key(sentence: str) -> bytes:
+    return blake2b(sentence.encode('utf-8'), digest_size=16).digest()
+
+# Короткие предложения не кэшируем: они засоряют кэш и почти не экономят запросов
+MIN_CACHED_SENTENCE_LEN = 8
+
+# Предел символов в одном запросе к модели: длинный текст проверяется частями параллельно
+MAX_CHARS = 1500
+
+# Версия промптов и формата кэша: увеличить при их изменении, чтобы не отдавать устаревшие ответы
+PROMPT_VERSION = 2
+# Постоянный кэш результатов проверки текстов и отдельных предложений (переживает перезапуск бота).
+# Открывается при старте бота (AIGrammarChecker.open), а не при импорте модуля
+CACHE_SIZE_LIMIT = 1 << 30
+
+# Общие правила для всех промптов проверки
+PROMPT_RULES = """ВАЖНО:
+- Не изменяй слова и фразы, обрамлённые в {{ ... }}.
+- Не изменяй слова и фразы, которые являются морфологическими формами или очень похожи на защищённые термины (даже если в них есть ошибки или опечатки). Просто выдели их как ошибочные, но не исправляй.
+- Если встречается слово, похожее на защищённый термин (например, с опечаткой или другим окончанием), не исправляй его, а только укажи на ошибку в объяснении.
+- Используй правила пунктуации русского языка: перед тире должен быть пробел, после тире — тоже, если это не дефис.
+- Не добавляй запятые после одиночных прилагательных или причастий, если это не оборот.
+- Если не уверен в пунктуации, не добавляй лишних запятых.
+"""
+
 # === Utility to load dictionary terms ===
-def load_dictionary_terms(path='словарь.txt') -> List[str]:
+DICTIONARY_PATH = 'словарь.txt'
+
+# Загрузка словарей pymorphy3 дорогая — анализатор создаётся один раз на процесс
+_MORPH = MorphAnalyzer()
+# Кэш форм терминов: словарь статичен, формы вычисляются один раз
+_TERM_FORMS: dict = {}  # {term: frozenset(forms)}
+_TERM_FORMS_LOCK = threading.Lock()
+
+def _term_forms(term: str) -> frozenset:
+    """Морфологические формы всех слов термина + сам термин"""
+    forms = {term}
+    for w in term.split():
+        parsed = _MORPH.parse(w)
+        if parsed:
+            forms.update(f.word for f in parsed[0].lexeme)
+    return frozenset(forms)
+
+def get_term_forms(term: str) -> frozenset:
+    forms = _TERM_FORMS.get(term)
+    if forms is None:
+        with _TERM_FORMS_LOCK:
+            forms = _TERM_FORMS.get(term)
+            if forms is None:
+                forms = _TERM_FORMS[term] = _term_forms(term)
+    return forms
+
+def build_term_automaton(forms) -> ahocorasick.Automaton:
+    """Строит автомат Ахо–Корасик по формам терминов (без учёта регистра)"""
+    automaton = ahocorasick.Automaton()
+    for form in forms:
+        key = form.lower()
+        automaton.add_word(key, len(key))
+    automaton.make_automaton()
+    return automaton
+
+@functools.lru_cache(maxsize=4)
+def _load_dictionary(path: str, mtime: float) -> tuple:
+    """
+    Читает словарь и готовит всё, что нужно для обрамления терминов.
+    Кэшируется по (path, mtime): файл перечитывается только после изменения.
+
+    Returns:
+        tuple: (термины, формы терминов в нижнем регистре, автомат Ахо–Корасик или None)
+    """
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    terms = [w.strip(' "\'') for w in _TERM_SPLIT_RE.split(content)]
+    # Сортируем один раз при загрузке: длинные термины первыми
+    terms = tuple(sorted((t for t in terms if t), key=len, reverse=True))
+    forms = set()
+    for term in terms:
+        forms |= get_term_forms(term)
+    automaton = build_term_automaton(forms) if forms else None
+    return terms, list({form.lower() for form in forms}), automaton
+
+def get_dictionary(path: str = DICTIONARY_PATH) -> tuple:
+    """Всё из одной загрузки словаря: (термины, формы в нижнем регистре, автомат или None)"""
     try:
-        with open(path, encoding='utf-8') as f:
-            content = f.read()
-        # Split by comma, handle quoted phrases, strip whitespace
-        terms = [w.strip(' "\'') for w in re.split(r',\s*', content)]
-        # Remove empty strings
-        return [t for t in terms if t]
+        return _load_dictionary(path, os.path.getmtime(path))
     except Exception as e:
         logging.error(f"[AI] Ошибка при загрузке словаря: {e}")
-        return []
+        return (), [], None
+
+def load_dictionary_terms(path=DICTIONARY_PATH) -> List[str]:
+    """Термины словаря, отсортированные по убыванию длины"""
+    return list(get_dictionary(path)[0])
+
+def get_dictionary_forms(path=DICTIONARY_PATH) -> List[str]:
+    """Формы всех терминов словаря в нижнем регистре (для нечёткого поиска)"""
+    return get_dictionary(path)[1]
+
+def get_term_automaton(path=DICTIONARY_PATH) -> Optional[ahocorasick.Automaton]:
+    """Автомат Ахо–Корасик по формам терминов словаря; None, если словарь пуст"""
+    return get_dictionary(path)[2]
 
 
 class AIGrammarChecker:
@@ -36,28 +153,145 @@ class AIGrammarChecker:
     MODEL_NAME = "deepseek-chat"
     API_URL = "https://api.deepseek.com/chat/completions"
 
-    def __init__(self):
+    def __init__(self, concurrency: int = 5):
         if not self.DEEPSEEK_API_KEY:
             raise ValueError("DEEPSEEK_API_KEY не найден в переменных окружения")
+        # Дисковый кэш: SQLite и файлы — блокирующий I/O, поэтому обращения к нему идут в потоках
+        self._cache: Optional[diskcache.Cache] = None
+        self._cache_lock = threading.Lock()
+        # Ограничиваем число одновременных запросов к DeepSeek
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Долгоживущий клиент: соединение и TLS переиспользуются между запросами
+        self._client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(60, connect=15),
+            headers={
+                "Authorization": f"Bearer {self.DEEPSEEK_API_KEY}",
+                "Content-Type": "application/json"
+            }
+        )
+
+    async def open(self):
+        """Открывает дисковый кэш из AI_CACHE_DIR (вне event loop)"""
+        await asyncio.to_thread(self._disk_cache)
+
+    async def close(self):
+        """Закрывает HTTP-клиент и дисковый кэш"""
+        await self._client.aclose()
+        if self._cache is not None:
+            await asyncio.to_thread(self._cache.close)
+
+    def _disk_cache(self) -> diskcache.Cache:
+        if self._cache is None:
+            with self._cache_lock:
+                if self._cache is None:
+                    self._cache = diskcache.Cache(
+                        os.getenv("AI_CACHE_DIR", "./ai_cache"), size_limit=CACHE_SIZE_LIMIT
+                    )
+        return self._cache
+
+    def _cache_get(self, key: str):
+        return self._disk_cache().get(key)
+
+    def _cache_get_many(self, keys: List[str]) -> list:
+        cache = self._disk_cache()
+        return [cache.get(key) for key in keys]
+
+    def _cache_set_many(self, items: List[Tuple[str, object]]):
+        cache = self._disk_cache()
+        for key, value in items:
+            cache.set(key, value)
+
+    async def _request(self, payload: dict) -> str:
+        """Отправляет запрос к DeepSeek и возвращает текст ответа модели"""
+        async with self._semaphore:
+            response = await self._client.post(self.API_URL, content=orjson.dumps(payload))
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        return data['choices'][0]['message']['content'].strip()
 
     def split_into_sentences(self, text: str) -> List[str]:
-        """Разделяет текст на предложения по . ? !"""
-        parts = re.split(r'(?<=[.?!])\s*', text)
-        return [p.strip() for p in parts if p.strip()]
+        """Разделяет текст на предложения по . ? ! за один проход (без регулярных выражений)"""
+        sentences = []
+        start = 0
+        i = 0
+        n = len(text)
+        while i < n:
+            if text[i] in '.?!':
+                # "?!", "..." и т.п. считаем одним концом предложения
+                i += 1
+                while i < n and text[i] in '.?!':
+                    i += 1
+                sentence = text[start:i].strip()
+                if sentence:
+                    sentences.append(sentence)
+                start = i
+            else:
+                i += 1
+        tail = text[start:].strip()
+        if tail:
+            sentences.append(tail)
+        if any(len(s) > MAX_CHARS for s in sentences):
+            sentences = [part for s in sentences for part in self._split_long(s)]
+        return sentences
 
-    def analyze_and_correct(self, sentence: str) -> Tuple[str, str]:
+    @staticmethod
+    def _safe_cut(sentence: str) -> int:
+        """Позиция разреза не дальше MAX_CHARS: по последнему пробелу вне обрамлённых терминов"""
+        spans = [m.span() for m in _WRAPPED_TERM_RE.finditer(sentence)]
+        limit = MAX_CHARS
+        while True:
+            cut = sentence.rfind(' ', 0, limit)
+            if cut <= 0:
+                break
+            inside = next((start for start, end in spans if start < cut < end), None)
+            if inside is None:
+                return cut
+            limit = inside
+        # Подходящего пробела нет — режем по границе обрамления, но не внутри него
+        for start, end in spans:
+            if start < MAX_CHARS < end:
+                return start or end
+        return MAX_CHARS
+
+    @classmethod
+    def _split_long(cls, sentence: str) -> List[str]:
+        """
+        Режет слишком длинное предложение (например, текст без знаков препинания) по пробелам.
+        Обрамлённые термины {{{ ... }}} не разрываются, иначе модель увидит незакрытое обрамление
+        """
+        parts = []
+        while len(sentence) > MAX_CHARS:
+            cut = cls._safe_cut(sentence)
+            parts.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            parts.append(sentence)
+        return parts
+
+    @staticmethod
+    def _chunk_sentences(sentences: List[str], chunk_size: Optional[int] = None) -> List[List[str]]:
+        """Группирует предложения в части не длиннее MAX_CHARS символов (и не больше chunk_size штук)"""
+        chunks = []
+        chunk = []
+        length = 0
+        for sentence in sentences:
+            if chunk and (length + len(sentence) > MAX_CHARS or len(chunk) == chunk_size):
+                chunks.append(chunk)
+                chunk = []
+                length = 0
+            chunk.append(sentence)
+            length += len(sentence)
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    async def analyze_and_correct(self, sentence: str) -> Tuple[str, str]:
         """Анализирует предложение и возвращает объяснение + исправленный вариант"""
         prompt = f"""
 Проанализируй это предложение на наличие грамматических, орфографических и пунктуационных ошибок.
 
-ВАЖНО:
-- Не изменяй слова и фразы, обрамлённые в {{{{ ... }}}}.
-- Не изменяй слова и фразы, которые являются морфологическими формами или очень похожи на защищённые термины (даже если в них есть ошибки или опечатки). Просто выдели их как ошибочные, но не исправляй.
-- Если встречается слово, похожее на защищённый термин (например, с опечаткой или другим окончанием), не исправляй его, а только укажи на ошибку в объяснении.
-- Используй правила пунктуации русского языка: перед тире должен быть пробел, после тире — тоже, если это не дефис.
-- Не добавляй запятые после одиночных прилагательных или причастий, если это не оборот.
-- Если не уверен в пунктуации, не добавляй лишних запятых.
-
+{PROMPT_RULES}
 Если есть ошибки:
 1. Кратко объясни, что было неправильно
 2. Предложи исправленный вариант (кроме защищённых терминов и их форм)
@@ -79,48 +313,195 @@ class AIGrammarChecker:
             "max_tokens": 200
         }
 
-        headers = {
-            "Authorization": f"Bearer {self.DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
         try:
-            response = requests.post(self.API_URL, headers=headers, json=payload, timeout=15)
-            response.raise_for_status()
-            content = response.json()['choices'][0]['message']['content'].strip()
+            content = await self._request(payload)
 
             # Парсим ответ
-            explanation_part = re.search(r"Объяснение:\s*(.*?)(?=\nИсправленное|$)", content, re.DOTALL)
-            corrected_part = re.search(r"Исправленное предложение:\s*(.*)", content)
+            explanation_part = _EXPL_RE.search(content)
+            corrected_part = _CORR_RE.search(content)
 
-            explanation = (explanation_part.group(1).strip() if explanation_part else "").strip()
-            corrected = corrected_part.group(1).strip() if corrected_part else sentence.strip()
-            corrected = corrected.strip("*")
+            explanation = explanation_part.group(1).strip() if explanation_part else ""
+            corrected = corrected_part.group(1).strip(" *\t\n") if corrected_part else sentence.strip()
 
             return explanation, corrected
 
         except Exception as e:
             logger.error(f"[AI] Ошибка при обращении к DeepSeek: {e}", exc_info=True)
-            return "Ошибка при анализе", sentence
+            return ANALYSIS_ERROR, sentence
+
+    async def analyze_batch(self, sentences: List[str]) -> List[Optional[Tuple[str, str]]]:
+        """
+        Анализирует все предложения одним запросом.
+        Возвращает список (объяснение, исправленный вариант) в порядке предложений;
+        None — если ответ для предложения отсутствует или повреждён.
+        """
+        numbered = "\n".join(f"{i}. {s}" for i, s in enumerate(sentences, 1))
+        prompt = f"""
+Проанализируй каждое из пронумерованных предложений на наличие грамматических, орфографических и пунктуационных ошибок.
+
+{PROMPT_RULES}
+Для каждого предложения:
+1. Кратко объясни, что было неправильно
+2. Предложи исправленный вариант (кроме защищённых терминов и их форм)
+
+Если ошибок нет — в объяснении напиши "Ошибок нет" и оставь предложение без изменений.
+
+Ответь строго в формате JSON:
+{{"sentences": [{{"index": 1, "original": "...", "corrected": "...", "explanation": "..."}}]}}
+В массиве должно быть ровно {len(sentences)} элементов — по одному на каждое предложение.
+
+ПРЕДЛОЖЕНИЯ:
+{numbered}
+"""
+
+        payload = {
+            "model": self.MODEL_NAME,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.5,
+            "max_tokens": min(200 * len(sentences), 8000),
+            "response_format": {"type": "json_object"}
+        }
 
-    def check_text_with_explanations(self, text: str) -> List[Tuple[str, str, str]]:
+        answers: List[Optional[Tuple[str, str]]] = [None] * len(sentences)
+        try:
+            items = orjson.loads(await self._request(payload)).get("sentences", [])
+        except Exception as e:
+            logger.error(f"[AI] Ошибка при пакетном обращении к DeepSeek: {e}", exc_info=True)
+            return answers
+
+        for item in items:
+            try:
+                idx = int(item["index"]) - 1
+                corrected = str(item["corrected"]).strip()
+                explanation = str(item.get("explanation", "")).strip()
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+            if 0 <= idx < len(sentences) and corrected:
+                answers[idx] = (explanation, corrected)
+
+        return answers
+
+    async def check_text_with_explanations(self, text: str) -> List[Correction]:
         """Проверяет весь текст и возвращает список: (оригинал, исправленный, объяснение)"""
         if not text or not isinstance(text, str):
             logger.warning("[AI] Недостаточно данных для анализа")
             return []
 
-        sentences = self.split_into_sentences(text)
+        key = self._text_cache_key(text)
+        results = await asyncio.to_thread(self._cache_get, key)
+        if results is None:
+            chunks = self._chunk_sentences(self.split_into_sentences(text))
+            checked = await asyncio.gather(*(self.check_sentences(chunk) for chunk in chunks))
+            results = [result for chunk in checked for result in chunk]
+            await self._store_text_results(key, results)
+        return results
+
+    async def iter_text_checks(self, text: str, chunk_size: int = 3) -> AsyncIterator[List[Correction]]:
+        """
+        Проверяет текст частями по chunk_size предложений (не длиннее MAX_CHARS символов).
+        Все части отправляются в модель сразу, а результаты выдаются по порядку
+        по мере готовности — первые ошибки можно показывать, не дожидаясь всего текста.
+        """
+        if not text or not isinstance(text, str):
+            logger.warning("[AI] Недостаточно данных для анализа")
+            return
+
+        key = self._text_cache_key(text)
+        cached = await asyncio.to_thread(self._cache_get, key)
+        if cached is not None:
+            yield cached
+            return
+
+        tasks = [
+            asyncio.create_task(self.check_sentences(chunk))
+            for chunk in self._chunk_sentences(self.split_into_sentences(text), chunk_size)
+        ]
         results = []
+        try:
+            for task in tasks:
+                chunk = await task
+                results.extend(chunk)
+                yield chunk
+            await self._store_text_results(key, results)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _text_cache_key(self, text: str) -> str:
+        return blake2b(f"{self.MODEL_NAME}|{PROMPT_VERSION}|{text}".encode('utf-8'), digest_size=16).hexdigest()
+
+    async def _store_text_results(self, key: str, results: List[Correction]):
+        """Сохраняет результат в постоянный кэш, если все предложения проверены успешно"""
+        if results and all(r.explanation != ANALYSIS_ERROR for r in results):
+            await asyncio.to_thread(self._cache_set_many, [(key, results)])
 
+    def _sentence_cache_key(self, key: bytes) -> str:
+        return f"s|{self.MODEL_NAME}|{PROMPT_VERSION}|{key.hex()}"
+
+    async def _get_cached_answers(self, sentences: List[str]) -> List[Optional[Tuple[str, str]]]:
+        """Ищет ответы модели для предложений сначала в памяти, затем (одним обращением) на диске"""
+        answers: List[Optional[Tuple[str, str]]] = [None] * len(sentences)
+        on_disk = []  # [(индекс, ключ), ...] — не найденные в памяти
         for i, sentence in enumerate(sentences):
-            logger.info(f"[AI] Проверяем предложение #{i + 1}: '{sentence}'")
+            if len(sentence) < MIN_CACHED_SENTENCE_LEN:
+                continue
+            key = _cache_key(sentence)
+            answers[i] = _LLM_CACHE.get(key)
+            if answers[i] is None:
+                on_disk.append((i, key))
+        if on_disk:
+            found = await asyncio.to_thread(self._cache_get_many, [self._sentence_cache_key(k) for _, k in on_disk])
+            for (i, key), answer in zip(on_disk, found):
+                if answer is not None:
+                    answers[i] = _LLM_CACHE[key] = answer
+        return answers
+
+    async def _store_answers(self, items: List[Tuple[str, Tuple[str, str]]]):
+        to_disk = []
+        for sentence, answer in items:
+            if len(sentence) < MIN_CACHED_SENTENCE_LEN or answer[0] == ANALYSIS_ERROR:
+                continue
+            key = _cache_key(sentence)
+            _LLM_CACHE[key] = answer
+            to_disk.append((self._sentence_cache_key(key), answer))
+        if to_disk:
+            await asyncio.to_thread(self._cache_set_many, to_disk)
 
-            # Получаем анализ и исправление
-            explanation, corrected = self.analyze_and_correct(sentence)
+    async def check_sentences(self, sentences: List[str]) -> List[Correction]:
+        """Проверяет список предложений и возвращает список: (оригинал, исправленный, объяснение)"""
+        if not sentences:
+            return []
+
+        # Уже проверенные предложения берём из кэша, в модель отправляем только новые
+        answers = await self._get_cached_answers(sentences)
+        pending = [i for i, answer in enumerate(answers) if answer is None]
+        if pending:
+            logger.info(f"[AI] Проверяем {len(pending)} из {len(sentences)} предложений одним запросом")
+            batch = await self.analyze_batch([sentences[i] for i in pending])
+            for i, answer in zip(pending, batch):
+                answers[i] = answer
+
+        # Предложения без корректного ответа перепроверяем по одному, параллельно
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+        if missing:
+            logger.warning(f"[AI] Нет ответа для {len(missing)} предложений, проверяем по одному")
+            retries = await asyncio.gather(
+                *(self.analyze_and_correct(sentences[i]) for i in missing),
+                return_exceptions=True
+            )
+            for i, answer in zip(missing, retries):
+                if isinstance(answer, BaseException):
+                    logger.error(f"[AI] Ошибка при анализе предложения '{sentences[i]}': {answer}")
+                    answer = (ANALYSIS_ERROR, sentences[i])
+                answers[i] = answer
 
-            if corrected != sentence:
-                results.append((sentence, corrected, explanation))
+        await self._store_answers([(sentences[i], answers[i]) for i in pending])
+
+        results = []
+        for sentence, (explanation, corrected) in zip(sentences, answers):
+            if corrected != sentence or explanation == ANALYSIS_ERROR:
+                results.append(Correction(sentence, corrected, explanation))
             else:
-                results.append((sentence, corrected, "Ошибок не найдено"))
+                results.append(Correction(sentence, corrected, "Ошибок не найдено"))
 
         return results
\ No newline at end of file
@@ -1,9 +1,8 @@
-import asyncio
-from telegram_bot import dp, bot
+from telegram_bot import run, main as run_bot
 
 async def main():
     print("🚀 Запуск Telegram-бота...")
-    await dp.start_polling(bot)
+    await run_bot()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    run(main())
\ No newline at end of file
@@ -1,25 +1,18 @@
 # merge_project.py
 
 import os
-
-def read_file(filename):
-    with open(filename, 'r', encoding='utf-8') as f:
-        return f.read()
-
-def write_file(filename, content):
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(content)
+import shutil
 
 def merge_files(file_list, output_file):
-    merged = ""
-    for file in file_list:
-        if not os.path.exists(file):
-            print(f"[!] Файл не найден: {file}")
-            continue
-        content = read_file(file)
-        merged += f"\n\n# === {file} ===\n\n"
-        merged += content
-    write_file(output_file, merged)
+    # Пишем по частям прямо в выходной файл, не собирая всё в одну строку
+    with open(output_file, 'w', encoding='utf-8') as out:
+        for file in file_list:
+            if not os.path.exists(file):
+                print(f"[!] Файл не найден: {file}")
+                continue
+            out.write(f"\n\n# === {file} ===\n\n")
+            with open(file, 'r', encoding='utf-8') as f:
+                shutil.copyfileobj(f, out)
     print(f"[+] Все файлы объединены в {output_file}")
 
 if __name__ == "__main__":
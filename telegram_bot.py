@@ -1,82 +1,247 @@
 import os
+import sys
+import logging
+import asyncio
+import functools
+import weakref
 import dotenv
+from contextlib import aclosing, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, NamedTuple, Optional, Set
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, MemoryStorageRecord
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram import Router, F
 from aiogram.filters import Command
-from ai import AIGrammarChecker
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.utils.formatting import Text, Bold, Code
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from ai import AIGrammarChecker, DICTIONARY_PATH, get_dictionary
 import re
-from pymorphy3 import MorphAnalyzer
-from rapidfuzz import fuzz
-
-# === Utility to load dictionary terms and wrap them in text ===
-def load_dictionary_terms(path='словарь.txt') -> list:
-    try:
-        with open(path, encoding='utf-8') as f:
-            content = f.read()
-        terms = [w.strip(' "\'') for w in re.split(r',\s*', content)]
-        return [t for t in terms if t]
-    except Exception as e:
-        return []
-
-def wrap_terms(text: str, terms: list) -> str:
-    morph = MorphAnalyzer()
-    words = re.findall(r'\w+|[\w-]+', text, re.UNICODE)
-    wrapped = set()
-    # Prepare all forms for each term
-    for term in sorted(terms, key=len, reverse=True):
-        if not term:
+import ahocorasick
+from cachetools import TTLCache
+from rapidfuzz import fuzz, process
+
+# === Скомпилированные регулярные выражения ===
+_WORD_RE = re.compile(r'\w+|[\w-]+', re.UNICODE)
+_UNWRAP_RE = re.compile(r'\{\{\{(.*?)\}\}\}')
+_DASH_RE = re.compile(r'(?<=\w) ?— ?(?=\w)')
+
+# === Utility to wrap dictionary terms in text ===
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+def find_term_spans(text: str, automaton: ahocorasick.Automaton) -> list:
+    """
+    Находит вхождения терминов целыми словами за один проход по тексту.
+    Пересечения разрешаются в пользу самого левого, затем самого длинного совпадения.
+    """
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # Редкие символы меняют длину при lower() — сохраняем их, чтобы не сбить смещения
+        lowered = "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+
+    candidates = []
+    for last, length in automaton.iter(lowered):
+        start, end = last - length + 1, last + 1
+        if start > 0 and _is_word_char(text[start - 1]):
+            continue
+        if end < len(text) and _is_word_char(text[end]):
             continue
-        term_words = term.split()
-        # Morphological forms for each word in the term
-        forms = set()
-        for w in term_words:
-            parsed = morph.parse(w)
-            for p in parsed:
-                forms.update({f.normal_form for f in p.lexeme})
-        # Add the original term and its forms
-        forms.add(term)
-        # Fuzzy match and wrap
-        for i, word in enumerate(words):
-            for form in forms:
-                # Fuzzy match: if similarity > 85% or exact match (case-insensitive)
-                if (fuzz.ratio(word.lower(), form.lower()) > 85 or word.lower() == form.lower()) and word not in wrapped:
-                    # Only wrap if not already wrapped
-                    pattern = re.compile(rf'(?<!\{{\{{\{{)\b{re.escape(word)}\b(?!\}}\}}\}})', re.UNICODE)
-                    text = pattern.sub(f'{{{{{{{word}}}}}}}', text)
-                    wrapped.add(word)
-    return text
+        candidates.append((start, end))
+
+    candidates.sort(key=lambda span: (span[0], -span[1]))
+    spans = []
+    last_end = 0
+    for start, end in candidates:
+        if start >= last_end:
+            spans.append((start, end))
+            last_end = end
+    return spans
+
+def _merge_spans(primary: list, secondary: list) -> list:
+    """Добавляет к primary интервалы из secondary, не пересекающиеся с ним (оба списка отсортированы)"""
+    extra = []
+    j = 0
+    for start, end in secondary:
+        while j < len(primary) and primary[j][1] <= start:
+            j += 1
+        if j < len(primary) and primary[j][0] < end:
+            continue
+        extra.append((start, end))
+    return sorted(primary + extra)
+
+def wrap_spans(text: str, spans: list) -> str:
+    """Обрамляет интервалы текста в {{{ }}} за один проход"""
+    parts = []
+    i = 0
+    for start, end in spans:
+        parts.append(text[i:start])
+        parts.append("{{{" + text[start:end] + "}}}")
+        i = end
+    parts.append(text[i:])
+    return "".join(parts)
+
+def wrap_terms(text: str, path: str = DICTIONARY_PATH) -> str:
+    # Автомат и формы берём из одной загрузки: файл мог измениться между двумя обращениями
+    _, forms, automaton = get_dictionary(path)
+    if automaton is None:
+        return text
+
+    # Точные совпадения терминов и их форм — один проход автомата
+    spans = find_term_spans(text, automaton)
+
+    # Нечёткие совпадения (опечатки): similarity > 85%.
+    # Одна матрица расстояний слов текста × форм терминов, считается в C.
+    # Функция уже выполняется в пуле потоков, поэтому rapidfuzz считает в одном потоке
+    words = list(set(_WORD_RE.findall(text)))
+    fuzzy_words = set()
+    if words:
+        scores = process.cdist(
+            [word.lower() for word in words], forms,
+            scorer=fuzz.ratio, score_cutoff=85, workers=1
+        )
+        fuzzy_words = {word for word, matched in zip(words, (scores > 85).any(axis=1)) if matched}
+
+    # Все вхождения нечётко совпавших слов вне точных совпадений
+    if fuzzy_words:
+        fuzzy_spans = [m.span() for m in _WORD_RE.finditer(text) if m.group() in fuzzy_words]
+        spans = _merge_spans(spans, fuzzy_spans)
+
+    return wrap_spans(text, spans)
 
 # Utility to unwrap {{{ }}} wrappers from text
 def unwrap_terms(text: str) -> str:
-    return re.sub(r'\{\{\{(.*?)\}\}\}', r'\1', text)
+    return _UNWRAP_RE.sub(r'\1', text)
 
 # Utility to fix dash spacing (—)
 def fix_dash_spacing(text: str) -> str:
     # Исправляет "слово—слово" на "слово — слово" (только для длинного тире)
-    # Не трогает дефисы внутри слов
-    text = re.sub(r'(\w)—(\w)', r'\1 — \2', text)
-    text = re.sub(r'(\w) —(\w)', r'\1 — \2', text)  # если нет пробела после тире
-    text = re.sub(r'(\w)— (\w)', r'\1 — \2', text)  # если нет пробела до тире
-    return text
+    # а также "слово —слово" и "слово— слово". Не трогает дефисы внутри слов
+    return _DASH_RE.sub(' — ', text)
 
 dotenv.load_dotenv()
+logger = logging.getLogger(__name__)
 
 # === Настройки бота ===
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 if not TOKEN:
     raise RuntimeError("TELEGRAM_BOT_TOKEN is not set in environment variables!")
-bot = Bot(token=TOKEN)
-storage = MemoryStorage()
+# Адрес Bot API (например, собственный telegram-bot-api сервер)
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER", "https://api.telegram.org").rstrip("/")
+# Соединения с Telegram API держим открытыми: TLS-рукопожатие и DNS не повторяются на каждый запрос
+bot_session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER), limit=100)
+bot_session._connector_init.update(keepalive_timeout=75, enable_cleanup_closed=True)
+bot = Bot(token=TOKEN, session=bot_session)
+
+# === Webhook ===
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # публичный адрес бота, например https://bot.example.com
+WEBHOOK_PATH = f"/webhook/{TOKEN}"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Бот обрабатывает только сообщения и нажатия кнопок — остальные типы не запрашиваем
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+# Общее хранилище FSM для нескольких процессов бота; без REDIS_URL — в памяти процесса
+REDIS_URL = os.getenv("REDIS_URL")  # например redis://localhost:6379/0
+STATE_TTL = 3600  # секунд, как у сессий проверки
+
+
+class SessionCache(TTLCache):
+    """TTLCache записей FSM, который сообщает в лог о вытеснении незавершённых сессий"""
+
+    def __missing__(self, key: StorageKey) -> MemoryStorageRecord:
+        record = self[key] = MemoryStorageRecord()
+        return record
+
+    def popitem(self):
+        key, record = super().popitem()
+        if record.data:
+            logger.warning(f"[BOT] Сессия чата {key.chat_id} вытеснена: хранилище переполнено")
+        return key, record
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for key, record in expired:
+            if record.data:
+                logger.warning(f"[BOT] Сессия чата {key.chat_id} истекла, проверка не завершена")
+        return expired
+
+
+class SessionStorage(MemoryStorage):
+    """MemoryStorage с ограниченным числом записей и временем жизни, как у RedisStorage"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        super().__init__()
+        self.storage = SessionCache(maxsize=maxsize, ttl=ttl)
+
+    # Запись заменяется целиком — так TTLCache продлевает время её жизни
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        record = self.storage[key]
+        state = state.state if isinstance(state, State) else state
+        self.storage[key] = MemoryStorageRecord(data=record.data, state=state)
+
+    async def set_data(self, key: StorageKey, data: dict) -> None:
+        record = self.storage[key]
+        self.storage[key] = MemoryStorageRecord(data=data.copy(), state=record.state)
+
+
+class SessionLocks(BaseEventIsolation):
+    """Блокировки сессий в памяти процесса; неиспользуемые удаляются сами (weakref)"""
+
+    def __init__(self):
+        self._locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncIterator[None]:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        async with lock:
+            yield
+
+    async def close(self) -> None:
+        self._locks.clear()
+
+
+if REDIS_URL:
+    from aiogram.fsm.storage.redis import RedisStorage
+    storage = RedisStorage.from_url(REDIS_URL, state_ttl=STATE_TTL, data_ttl=STATE_TTL)
+    session_isolation: BaseEventIsolation = storage.create_isolation()
+else:
+    # Ограниченное хранилище: брошенные сессии вытесняются через час или при переполнении
+    storage = SessionStorage(maxsize=10_000, ttl=STATE_TTL)
+    session_isolation = SessionLocks()
+# Блокировка берётся только на чтение-изменение-запись сессии (см. edit_session),
+# а не на весь обработчик: иначе кнопки не работали бы, пока идёт проверка текста
 dp = Dispatcher(storage=storage)
+dp.shutdown.register(storage.close)
+dp.shutdown.register(session_isolation.close)
 router = Router()
 dp.include_router(router)
 
 # === Инициализация AI-модуля ===
 checker = AIGrammarChecker()
+dp.startup.register(checker.open)
+dp.shutdown.register(checker.close)
+
+# Пул потоков для синхронной CPU-работы (обрамление терминов словаря)
+executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+
+
+async def shutdown_executor():
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+dp.shutdown.register(shutdown_executor)
 
 # === FSM состояния ===
 class CorrectionState(StatesGroup):
@@ -85,7 +250,201 @@ class CorrectionState(StatesGroup):
 
 
 # === Хранение данных пользователей ===
-user_sessions = {}  # {chat_id: {"original_text": ..., "errors": [...], "current_idx": 0}}
+class FoundError(NamedTuple):
+    """Найденная ошибка; start/end — позиция orig в original_text"""
+    start: int
+    end: int
+    orig: str
+    fixed: str
+    explanation: str
+
+
+@dataclass(slots=True)
+class Session:
+    """
+    Состояние проверки текста одного чата.
+    Хранится в данных FSM (изменяется через edit_session): при RedisStorage оно доступно всем
+    процессам бота и переживает перезапуск. Класс — только типизированное представление этих данных.
+    """
+    session_id: int         # id сообщения с текстом: отличает проверку от более новой
+    original_text: str
+    errors: List[FoundError] = field(default_factory=list)
+    accepted: Set[int] = field(default_factory=set)   # индексы принятых исправлений
+    reviewed: Set[int] = field(default_factory=set)   # индексы ошибок, по которым уже принято решение
+    checking: bool = True   # проверка ещё идёт
+    list_message_id: Optional[int] = None  # сообщение со списком всех ошибок
+    open_index: Optional[int] = None  # ошибка, карточка которой сейчас показана вместо списка
+
+    @classmethod
+    def from_data(cls, data: dict) -> Optional["Session"]:
+        if "session_id" not in data:
+            return None
+        return cls(
+            session_id=data["session_id"],
+            original_text=data["original_text"],
+            errors=[FoundError(*error) for error in data["errors"]],
+            accepted=set(data["accepted"]),
+            reviewed=set(data["reviewed"]),
+            checking=data["checking"],
+            list_message_id=data["list_message_id"],
+            open_index=data["open_index"]
+        )
+
+    def to_data(self) -> dict:
+        # Только JSON-совместимые типы: данные FSM могут храниться в Redis
+        return {
+            "session_id": self.session_id,
+            "original_text": self.original_text,
+            "errors": [list(error) for error in self.errors],
+            "accepted": sorted(self.accepted),
+            "reviewed": sorted(self.reviewed),
+            "checking": self.checking,
+            "list_message_id": self.list_message_id,
+            "open_index": self.open_index
+        }
+
+
+async def get_session(state: FSMContext) -> Optional[Session]:
+    return Session.from_data(await state.get_data())
+
+
+@asynccontextmanager
+async def edit_session(state: FSMContext, session_id: Optional[int] = None) -> AsyncIterator[Optional[Session]]:
+    """
+    Сессия под блокировкой чата; изменения сохраняются при выходе из блока.
+    update_data в aiogram — это get_data + set_data всего словаря, поэтому без блокировки
+    параллельные обработчики (и процессы при RedisStorage) затирали бы изменения друг друга.
+    Отдаёт None, если сессии нет или она не совпадает с session_id.
+    """
+    async with session_isolation.lock(state.key):
+        session = await get_session(state)
+        if session is not None and session_id is not None and session.session_id != session_id:
+            session = None
+        yield session
+        if session is not None:
+            await state.set_data(session.to_data())
+
+
+SESSION_EXPIRE_INTERVAL = 60  # секунд
+_background_tasks: set = set()
+
+
+async def expire_sessions(cache: SessionCache):
+    """Периодически удаляет истёкшие сессии, даже если к хранилищу никто не обращается"""
+    while True:
+        await asyncio.sleep(SESSION_EXPIRE_INTERVAL)
+        cache.expire()
+
+
+async def start_background_tasks():
+    # В Redis сессии истекают сами (data_ttl)
+    if isinstance(storage, SessionStorage):
+        task = asyncio.create_task(expire_sessions(storage.storage))
+        _background_tasks.add(task)
+
+
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+
+
+dp.startup.register(start_background_tasks)
+dp.shutdown.register(stop_background_tasks)
+
+
+# === Сообщения и клавиатуры ===
+MAX_MESSAGE_LEN = 4096
+BUTTONS_PER_ROW = 5
+# Предел длины каждого из трёх полей карточки ошибки, чтобы она влезала в одно сообщение
+CARD_FIELD_LEN = (MAX_MESSAGE_LEN - 128) // 3
+
+
+def _shorten(text: str, limit: int = CARD_FIELD_LEN) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _is_not_modified(error: TelegramBadRequest) -> bool:
+    """Telegram отклоняет правку, которая не меняет сообщение, — это не ошибка"""
+    return "message is not modified" in error.message
+
+
+@functools.lru_cache(maxsize=256)
+def correction_kb(idx: int) -> InlineKeyboardMarkup:
+    """Клавиатура принятия исправления (одна на индекс, переиспользуется)"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Принять", callback_data=f"accept:{idx}"),
+         InlineKeyboardButton(text="❌ Оставить", callback_data=f"reject:{idx}")]
+    ])
+
+
+def error_list_kb(session: Session) -> InlineKeyboardMarkup:
+    """Кнопка на каждую ошибку (с отметкой о решении) и кнопка завершения"""
+    buttons = []
+    for i in range(len(session.errors)):
+        mark = "✅ " if i in session.accepted else "❌ " if i in session.reviewed else ""
+        buttons.append(InlineKeyboardButton(text=f"{mark}{i + 1}", callback_data=f"fix:{i}"))
+    rows = [buttons[i:i + BUTTONS_PER_ROW] for i in range(0, len(buttons), BUTTONS_PER_ROW)]
+    rows.append([InlineKeyboardButton(text="🏁 Завершить", callback_data="done")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def render_error_list(session: Session) -> Text:
+    header = f"📌 Найдено ошибок: {len(session.errors)}\n\n"
+    footer = "\n\n⏳ Проверка продолжается..." if session.checking else ""
+    footer += "\n\nНажмите на номер, чтобы принять или отклонить исправление."
+
+    parts = [header]
+    length = len(header) + len(footer)
+    for i, error in enumerate(session.errors):
+        orig, corrected, explanation = (fix_dash_spacing(error.orig), fix_dash_spacing(error.fixed),
+                                        fix_dash_spacing(error.explanation))
+        block_len = len(orig) + len(corrected) + len(explanation) + 24
+        # Не выходим за лимит Telegram: остальные ошибки доступны по кнопкам
+        if length + block_len + 64 > MAX_MESSAGE_LEN:
+            parts.append(f"…и ещё {len(session.errors) - i} — нажмите на номер, чтобы посмотреть.")
+            break
+        if i:
+            parts.append("\n\n")
+        parts.extend((
+            f"{i + 1}) ", Bold("Было:"), " ", Code(orig), "\n",
+            Bold("Стало:"), " ", Code(corrected), "\n",
+            explanation
+        ))
+        length += block_len
+    parts.append(footer)
+    return Text(*parts)
+
+
+async def send_error_list(state: FSMContext):
+    """Показывает все найденные ошибки одним сообщением (или обновляет уже отправленное)"""
+    # Отрисовка и правка — под блокировкой сессии: правки списка и карточки в чате идут
+    # по очереди, и более старое содержимое не перезаписывает более новое
+    async with edit_session(state) as session:
+        if not session:
+            return
+        if session.open_index is not None:
+            # Вместо списка сейчас показана карточка ошибки — список обновится после решения
+            return
+
+        chat_id = state.key.chat_id
+        content = render_error_list(session).as_kwargs()
+        kb = error_list_kb(session)
+        if session.list_message_id is None:
+            message = await bot.send_message(chat_id, **content, reply_markup=kb)
+            session.list_message_id = message.message_id
+            return
+
+        try:
+            await bot.edit_message_text(
+                **content,
+                chat_id=chat_id,
+                message_id=session.list_message_id,
+                reply_markup=kb
+            )
+        except TelegramBadRequest as e:
+            if not _is_not_modified(e):
+                raise
 
 
 @router.message(Command("start"))
@@ -97,150 +456,239 @@ async def cmd_start(message: types.Message, state: FSMContext):
 @router.message(F.text, CorrectionState.waiting_for_text)
 async def process_user_text(message: types.Message, state: FSMContext):
     user_text = message.text or ""
-    chat_id = message.chat.id
 
-    # Load and wrap dictionary terms
-    terms = load_dictionary_terms()
-    wrapped_text = wrap_terms(user_text, terms)
+    # Wrap dictionary terms (словарь загружается один раз и кэшируется).
+    # Это CPU-работа — выполняем её в пуле потоков, чтобы не блокировать event loop
+    loop = asyncio.get_running_loop()
+    wrapped_text = await loop.run_in_executor(executor, wrap_terms, user_text)
 
     await message.answer("🔍 Анализируем ваш текст на наличие ошибок...")
 
-    results = checker.check_text_with_explanations(wrapped_text or "")  # [(orig, fixed, explanation), ...]
-    error_sentences = [item for item in results if item[0] != item[1]]
+    # Сессия создаётся сразу: ошибки добавляются по мере готовности частей текста
+    session_id = message.message_id
+    async with session_isolation.lock(state.key):
+        await state.set_data(Session(session_id=session_id, original_text=user_text).to_data())
+    await state.set_state(CorrectionState.correcting)
 
-    if not error_sentences:
+    cursor = 0  # позиция в user_text, с которой ищем следующее предложение
+    async with aclosing(checker.iter_text_checks(wrapped_text or "")) as checks:
+        async for results in checks:  # [Correction, ...]
+            # Снимаем обрамление терминов один раз — дальше в сессии хранятся готовые строки.
+            # Короткие объяснения часто повторяются, поэтому интернируем их: SessionStorage держит
+            # в памяти те же объекты строк, и одинаковые объяснения хранятся один раз
+            # (при RedisStorage данные сериализуются и интернирование ничего не даёт)
+            new_errors = []
+            for result in results:
+                orig, fixed = unwrap_terms(result.orig), unwrap_terms(result.fixed)
+                # Запоминаем, где предложение стоит в исходном тексте, — чтобы потом
+                # применить все принятые исправления за один проход
+                start = user_text.find(orig, cursor)
+                end = start + len(orig) if start >= 0 else -1
+                if start >= 0:
+                    cursor = end
+                if orig != fixed:
+                    if start < 0:
+                        # Исправление некуда применить — не предлагаем его принять
+                        logger.warning(f"[BOT] Предложение '{orig}' не найдено в исходном тексте, ошибка пропущена")
+                        continue
+                    explanation = sys.intern(unwrap_terms(result.explanation))
+                    new_errors.append(FoundError(start, end, orig, fixed, explanation))
+            async with edit_session(state, session_id) as session:
+                if not session:
+                    # Сессия истекла, была заменена или завершена — дальше проверять незачем
+                    return
+                session.errors.extend(new_errors)
+            if new_errors:
+                await send_error_list(state)
+
+    async with edit_session(state, session_id) as session:
+        if not session:
+            return
+        session.checking = False
+    if not session.errors:
         await message.answer("✅ Ошибок не найдено!")
         await state.clear()
-        return
-
-    # Сохраняем данные
-    user_sessions[chat_id] = {
-        "original_text": user_text,
-        "errors": error_sentences,
-        "current_idx": 0,
-    }
-
-    await state.set_state(CorrectionState.correcting)
-    await send_next_error(chat_id)
+    elif len(session.reviewed) == len(session.errors):
+        await finish_correction(state, session_id)
+    else:
+        await send_error_list(state)
 
 
-async def send_next_error(chat_id: int):
-    session = user_sessions.get(chat_id)
-    if not session or session.get("current_idx") is None or session["current_idx"] >= len(session["errors"]):
-        await finish_correction(chat_id)
-        return
+def _is_session_message(callback: CallbackQuery, session: Session) -> bool:
+    """Кнопка нажата в сообщении текущей сессии (список и карточка — одно сообщение), а не в старом"""
+    return callback.message.message_id == session.list_message_id
 
-    orig, corrected, explanation = session["errors"][session["current_idx"]]
-    # Unwrap for user display
-    orig = fix_dash_spacing(unwrap_terms(orig))
-    corrected = fix_dash_spacing(unwrap_terms(corrected))
-    explanation = fix_dash_spacing(unwrap_terms(explanation))
 
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🛠️ Исправить", callback_data="suggest"),
-         InlineKeyboardButton(text="➡️ Пропустить", callback_data="skip")]
-    ])
-
-    await bot.send_message(
-        chat_id,
-        f"📌 Найдена ошибка:\n\n"
-        f"<b>Было:</b> <code>{orig}</code>\n\n"
-        f"<b>Объяснение:</b> {explanation}\n\n"
-        f"<b>Как будет:</b> <code>{corrected}</code>",
-        reply_markup=kb,
-        parse_mode="HTML"
-    )
+def _parse_index(data: str, session: Session) -> Optional[int]:
+    """Достаёт индекс ошибки из callback_data вида "fix:3" """
+    try:
+        idx = int(data.split(":", 1)[1])
+    except (IndexError, ValueError):
+        return None
+    return idx if 0 <= idx < len(session.errors) else None
 
 
-@router.callback_query(F.data.in_({"suggest", "skip"}))
+@router.callback_query(F.data.startswith("fix:"))
 async def handle_choice(callback: CallbackQuery, state: FSMContext):
     if not callback.message:
         await callback.answer("⚠️ Нет сообщения.")
         return
-    chat_id = callback.message.chat.id
-    choice = callback.data
-    session = user_sessions.get(chat_id)
+    session = await get_session(state)
 
-    if not session:
+    if not session or not _is_session_message(callback, session):
         await callback.answer("⚠️ Сессия истекла.")
         return
 
-    orig, corrected, _ = session["errors"][session["current_idx"]]
-    # Unwrap for user display
-    orig = fix_dash_spacing(unwrap_terms(orig))
-    corrected = fix_dash_spacing(unwrap_terms(corrected))
-
-    if choice == "suggest":
-        kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Принять", callback_data="accept"),
-             InlineKeyboardButton(text="❌ Оставить", callback_data="reject")]
-        ])
-
-        await bot.send_message(
-            chat_id,
-            f"🛠️ Вот предложенное исправление:\n\n"
-            f"➡️ <b>Было:</b> <code>{orig}</code>\n"
-            f"🟰 <b>Стало:</b> <code>{corrected}</code>",
-            reply_markup=kb,
-            parse_mode="HTML"
-        )
-
-        session["last_correction"] = (orig, corrected)
-    else:
-        session["current_idx"] += 1
-        await send_next_error(chat_id)
-
-    await callback.answer()
+    idx = _parse_index(callback.data, session)
+    if idx is None:
+        await callback.answer("⚠️ Нет доступного исправления.")
+        return
 
+    error = session.errors[idx]
+    content = Text(
+        f"🛠️ Исправление №{idx + 1}:\n\n",
+        "➡️ ", Bold("Было:"), " ", Code(_shorten(fix_dash_spacing(error.orig))), "\n",
+        "🟰 ", Bold("Стало:"), " ", Code(_shorten(fix_dash_spacing(error.fixed))), "\n\n",
+        Bold("Объяснение:"), " ", _shorten(fix_dash_spacing(error.explanation))
+    )
 
-@router.callback_query(F.data.in_({"accept", "reject"}))
+    async def show_card():
+        # Под блокировкой сессии, как и правка списка в send_error_list: параллельное
+        # обновление списка не перезапишет карточку
+        async with edit_session(state, session.session_id) as current:
+            if not current or not _is_session_message(callback, current):
+                return
+            try:
+                await callback.message.edit_text(**content.as_kwargs(), reply_markup=correction_kb(idx))
+            except TelegramBadRequest as e:
+                # "not modified" — карточка уже показана (повторное нажатие)
+                if not _is_not_modified(e):
+                    raise
+            # Пока показана карточка, список не обновляется — отмечаем это только после успешного показа
+            current.open_index = idx
+
+    # Показываем карточку в том же сообщении и отвечаем на callback параллельно
+    await asyncio.gather(show_card(), callback.answer())
+
+
+@router.callback_query(F.data.startswith("accept:") | F.data.startswith("reject:"))
 async def handle_correction(callback: CallbackQuery, state: FSMContext):
     if not callback.message:
         await callback.answer("⚠️ Нет сообщения.")
         return
-    chat_id = callback.message.chat.id
-    choice = callback.data
-    session = user_sessions.get(chat_id)
-
-    if not session or "last_correction" not in session:
+    async with edit_session(state) as session:
+        current = session is not None and _is_session_message(callback, session)
+        idx = _parse_index(callback.data, session) if current else None
+        if idx is not None:
+            if callback.data.startswith("accept:"):
+                session.accepted.add(idx)
+            else:
+                session.accepted.discard(idx)
+            session.reviewed.add(idx)
+            session.open_index = None
+    if not current:
+        await callback.answer("⚠️ Сессия истекла.")
+        return
+    if idx is None:
         await callback.answer("⚠️ Нет доступного исправления.")
         return
 
-    original, corrected = session["last_correction"]
-    # Unwrap for user display
-    original = fix_dash_spacing(unwrap_terms(original))
-    corrected = fix_dash_spacing(unwrap_terms(corrected))
-
-    if choice == "accept":
-        session["original_text"] = session["original_text"].replace(original, corrected, 1)
-
-    session["current_idx"] += 1
-    del session["last_correction"]
+    notice = "✅ Исправление принято" if callback.data.startswith("accept:") else "❌ Оставлено без изменений"
 
-    await callback.answer()
-    await send_next_error(chat_id)
+    if not session.checking and len(session.reviewed) == len(session.errors):
+        next_step = finish_correction(state, session.session_id)
+    else:
+        # Возвращаем список на место карточки
+        next_step = send_error_list(state)
+    await asyncio.gather(callback.answer(notice), next_step)
 
 
-async def finish_correction(chat_id: int):
-    session = user_sessions.pop(chat_id, None)
-    if not session:
+@router.callback_query(F.data == "done")
+async def handle_done(callback: CallbackQuery, state: FSMContext):
+    if not callback.message:
+        await callback.answer("⚠️ Нет сообщения.")
         return
+    session = await get_session(state)
+    if not session or not _is_session_message(callback, session):
+        await callback.answer("⚠️ Сессия истекла.")
+        return
+    await callback.answer()
+    # Непросмотренные ошибки остаются без изменений
+    await finish_correction(state, session.session_id)
+
+
+async def finish_correction(state: FSMContext, session_id: int):
+    async with session_isolation.lock(state.key):
+        session = await get_session(state)
+        if not session or session.session_id != session_id:
+            return
+        await state.set_data({})
+
+    # Собираем итоговый текст за один проход: ошибки хранятся в порядке следования в тексте
+    text = session.original_text
+    parts = []
+    cur = 0
+    for idx, error in enumerate(session.errors):
+        # Пропускаем ненайденные и пересекающиеся с уже применёнными фрагменты:
+        # иначе cur сдвинулся бы назад и текст продублировался бы
+        if error.start < 0 or error.start < cur or idx not in session.accepted:
+            continue
+        parts.append(text[cur:error.start])
+        parts.append(error.fixed)
+        cur = error.end
+    parts.append(text[cur:])
+    edited_text = fix_dash_spacing("".join(parts))
+
+    content = Text(
+        "🎉 Все предложения проверены!\n\n",
+        "📄 ", Bold("Итоговый текст:"), "\n\n",
+        Code(edited_text)
+    )
+    await bot.send_message(state.key.chat_id, **content.as_kwargs())
 
-    edited_text = fix_dash_spacing(unwrap_terms(session["original_text"]))
 
-    await bot.send_message(
-        chat_id,
-        "🎉 Все предложения проверены!\n\n"
-        "📄 <b>Итоговый текст:</b>\n\n"
-        f"<code>{edited_text}</code>",
-        parse_mode="HTML"
+# === Запуск бота ===
+def run(coro):
+    """Запускает корутину на uvloop (если он установлен и это не Windows), иначе на стандартном цикле asyncio"""
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            return uvloop.run(coro)
+        except ImportError:
+            pass
+    return asyncio.run(coro)
+
+
+async def start_webhook():
+    """Принимает обновления через webhook: Telegram сам присылает их на aiohttp-сервер"""
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    await bot.set_webhook(
+        f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        allowed_updates=ALLOWED_UPDATES,
+        drop_pending_updates=True,
+        secret_token=WEBHOOK_SECRET
     )
 
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
 
-# === Запуск бота ===
 async def main():
-    await dp.start_polling(bot)
+    # Webhook, если задан публичный адрес; иначе — long polling (удобно для локального запуска)
+    if WEBHOOK_URL:
+        await start_webhook()
+    else:
+        # Снимаем webhook (если был) и не разбираем накопившиеся за простой обновления
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot, allowed_updates=ALLOWED_UPDATES, handle_signals=True, close_bot_session=True)
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
\ No newline at end of file
+    run(main())
\ No newline at end of file
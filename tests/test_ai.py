@@ -0,0 +1,30 @@
+import re
+
+from ai import AIGrammarChecker, MAX_CHARS
+
+# То же снятие обрамления, что и в telegram_bot.unwrap_terms
+_UNWRAP_RE = re.compile(r'\{\{\{(.*?)\}\}\}')
+
+
+def test_split_long_keeps_wrapped_terms_whole():
+    term = "{{{Кружок качества быстрого реагирования}}}"
+    sentence = " ".join(["слово"] * 248 + [term] + ["слово"] * 300)
+
+    parts = AIGrammarChecker._split_long(sentence)
+
+    assert len(parts) > 1
+    assert all(len(part) <= MAX_CHARS for part in parts)
+    assert sum(term in part for part in parts) == 1
+    for part in parts:
+        assert "{" not in _UNWRAP_RE.sub(r'\1', part) and "}" not in _UNWRAP_RE.sub(r'\1', part)
+    assert " ".join(parts) == sentence
+
+
+def test_split_long_without_spaces_cuts_outside_wrapper():
+    term = "{{{" + "т" * 20 + "}}}"
+    sentence = "а" * (MAX_CHARS - 10) + term + "б" * 100
+
+    parts = AIGrammarChecker._split_long(sentence)
+
+    assert "".join(parts) == sentence
+    assert all(_UNWRAP_RE.sub(r'\1', part).count("{") == 0 for part in parts)